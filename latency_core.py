@@ -0,0 +1,62 @@
+"""
+Per-event hot path for the latency tracker.
+
+The functions here take plain values and the preallocated sample buffers
+(no tracker instance), and carry PEP 484 annotations so the module can be
+compiled ahead of time:
+
+    mypyc latency_core.py
+
+A compiled extension in the same directory is imported in preference to this
+file, so the pure-Python version is used whenever no build is present.
+"""
+
+import heapq
+from typing import Any, List
+
+NS_PER_MS = 1_000_000
+
+
+def record_event(event_timestamp: Any, receive_time_ns: int, index: int,
+                 raw_latencies: Any, event_timestamps: Any) -> int:
+    """Store one event at ``index`` in the sample buffers and return its raw latency in ns.
+
+    ``event_timestamp`` is Polymarket's integer-millisecond timestamp, either as
+    a string or a number.
+    """
+    event_timestamp_ns: int = int(event_timestamp) * NS_PER_MS
+    raw_latency_ns: int = receive_time_ns - event_timestamp_ns
+    raw_latencies[index] = raw_latency_ns
+    event_timestamps[index] = event_timestamp_ns
+    return raw_latency_ns
+
+
+class RunningMedian:
+    """Streaming median over pushed values using a max-heap / min-heap pair.
+
+    push() is O(log n) and median() is O(1), so a calibration window of any
+    size never needs a sort at the boundary.
+    """
+
+    def __init__(self) -> None:
+        self._lo: List[int] = []  # max-heap of the lower half (values negated)
+        self._hi: List[int] = []  # min-heap of the upper half
+
+    def push(self, value: int) -> None:
+        """Add a value, keeping len(_lo) equal to len(_hi) or one larger."""
+        lo = self._lo
+        hi = self._hi
+        if not lo or value <= -lo[0]:
+            heapq.heappush(lo, -value)
+            if len(lo) > len(hi) + 1:
+                heapq.heappush(hi, -heapq.heappop(lo))
+        else:
+            heapq.heappush(hi, value)
+            if len(hi) > len(lo):
+                heapq.heappush(lo, -heapq.heappop(hi))
+
+    def median(self) -> float:
+        """Median of the values pushed so far (raises IndexError when empty)."""
+        if len(self._lo) > len(self._hi):
+            return float(-self._lo[0])
+        return (-self._lo[0] + self._hi[0]) / 2
@@ -7,42 +7,201 @@ collects 100 events, and calculates the median latency between
 event timestamps and local receipt time.
 """
 
+import asyncio
+import http.client
+import io
 import json
-import time
-import statistics
+import logging
+import os
+import socket
+import sys
 import threading
+import time
+from collections import deque
 from datetime import datetime, timezone
-from typing import List, Dict, Any
-import requests
-from websocket import WebSocketApp
+from typing import List, Dict, Any, Optional, Union
+from urllib.parse import quote
+from urllib.request import urlopen
+import numpy as np
+from websocket import ABNF, WebSocketApp
+
+from latency_core import RunningMedian, record_event
+
+try:
+    import orjson
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError (and so ValueError)
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps  # returns UTF-8 bytes
+except ImportError:
+    orjson = None
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+# Optional typed decoder for the fixed market event schema
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+if msgspec is not None:
+    class MarketEvent(msgspec.Struct, gc=False):
+        """The market channel fields the tracker reads; all other fields are skipped while decoding."""
+        timestamp: Union[str, int, float, None] = None
+        event_type: str = "unknown"
+else:
+    MarketEvent = None  # type(event) is never None, so the typed path is skipped
+
+# Optional asyncio transports (--asyncio, --aiohttp)
+try:
+    from websockets.asyncio.client import connect as ws_connect
+    from websockets.exceptions import ConnectionClosed, WebSocketException
+except ImportError:
+    ws_connect = None
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+logger = logging.getLogger(__name__)
+
+# Linux NAPI busy-poll socket options (not exported by the socket module). Every transport
+# waits in select/epoll, which only busy-polls when the net.core.busy_poll sysctl is non-zero.
+SO_BUSY_POLL = getattr(socket, "SO_BUSY_POLL", 46)
+SO_PREFER_BUSY_POLL = getattr(socket, "SO_PREFER_BUSY_POLL", 69)
+BUSY_POLL_USECS = 50
+BUSY_POLL_SYSCTL = "/proc/sys/net/core/busy_poll"
+
+# Keepalive: every transport sends a WebSocket protocol ping every PING_INTERVAL seconds and
+# drops the connection if no pong arrives within PING_TIMEOUT seconds. These replace
+# Polymarket's application-level text "PING"/"PONG" messages, so no text PONG is expected.
+# Only websocket-client lets the ping carry a payload (PING_PAYLOAD).
+PING_INTERVAL = 10
+PING_TIMEOUT = 5
+PING_PAYLOAD = "PING"
+
+# Seconds to wait on the market-info REST call
+API_TIMEOUT = 10
+
+# Seconds between background flushes of buffered progress lines
+LOG_FLUSH_INTERVAL = 0.5
+
+# SCHED_FIFO priority for the receive thread when pinned and running as root
+RECEIVE_THREAD_PRIORITY = 50
+
+# Transport name -> package providing it (None = required dependency)
+TRANSPORTS = {
+    "websocket-client": None,
+    "websockets": "websockets",
+    "aiohttp": "aiohttp",
+}
+
+
+def _event_type(event: Any) -> str:
+    """Event type of a decoded MarketEvent or event dict, for log lines."""
+    if type(event) is MarketEvent:
+        return event.event_type
+    return event.get('event_type', 'unknown')
+
+
+def busy_poll_sysctl() -> Optional[int]:
+    """Return net.core.busy_poll in microseconds, or None if it cannot be read (Linux only)."""
+    try:
+        with open(BUSY_POLL_SYSCTL) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def nic_irq_cpu() -> Optional[int]:
+    """Return the CPU servicing most interrupts for the default-route NIC (Linux only)."""
+    try:
+        # Default route has destination 00000000
+        with open("/proc/net/route") as f:
+            next(f)
+            iface = next((fields[0] for fields in map(str.split, f) if fields[1] == "00000000"), None)
+        if iface is None:
+            return None
+
+        with open("/proc/interrupts") as f:
+            cpus = f.readline().split()
+            totals = [0] * len(cpus)
+            for line in f:
+                if iface in line:
+                    for i, count in enumerate(line.split()[1:1 + len(cpus)]):
+                        if count.isdigit():
+                            totals[i] += int(count)
+    except (OSError, StopIteration, IndexError):
+        return None
+
+    if not any(totals):
+        return None
+    return int(cpus[totals.index(max(totals))][len("CPU"):])
 
 
 class PolymarketLatencyTracker:
-    def __init__(self, market_slug: str, num_events: int = 100, calibration_events: int = 10, verbose: bool = False):
+    def __init__(self, market_slug: str, num_events: int = 100, calibration_events: int = 10, verbose: bool = False,
+                 transport: str = "websocket-client", busy_poll: bool = False, cpu: Optional[int] = None):
+        if num_events < 1:
+            raise ValueError(f"num_events must be at least 1 (got {num_events})")
         self.market_slug = market_slug
         self.num_events = num_events
         self.calibration_events = min(calibration_events, num_events // 2)  # At most half the events
         self.verbose = verbose
+        self.transport = transport  # One of TRANSPORTS
+        self.busy_poll = busy_poll
+        self.cpu = cpu  # CPU to pin the receive thread to (None = no pinning)
         self.ws_url = "wss://ws-subscriptions-clob.polymarket.com/ws/market"
-        self.api_url = f"https://gamma-api.polymarket.com/markets/slug/{market_slug}"
+        self.api_url = f"https://gamma-api.polymarket.com/markets/slug/{quote(market_slug, safe='')}"
 
-        self.raw_latencies: List[float] = []  # Raw latencies (with clock offset)
-        self.adjusted_latencies: List[float] = []  # Adjusted latencies (offset removed)
-        self.event_timestamps: List[float] = []  # Event timestamps for analysis
-        self.receive_timestamps: List[float] = []  # Receive timestamps for analysis
+        # Preallocated sample buffers in integer nanoseconds, filled up to events_received / adjusted_count
+        self.raw_latencies = np.empty(num_events, dtype=np.int64)  # Raw latencies (with clock offset)
+        self.adjusted_latencies = np.empty(num_events, dtype=np.int64)  # Adjusted latencies (offset removed)
+        self.event_timestamps = np.empty(num_events, dtype=np.int64)  # Event timestamps for analysis
         self.events_received = 0
+        self.adjusted_count = 0
         self.token_ids: List[str] = []
         self.ws: WebSocketApp = None
-        self.ping_thread = None
-        self.clock_offset: float = None  # Estimated clock offset in ms
+        self._subscribe_payload: bytes = b""  # Encoded once token IDs are known
+        # Frames are either a single event or an array of events (initial book snapshots)
+        self._decoder = msgspec.json.Decoder(Union[MarketEvent, List[MarketEvent]]) if msgspec else None
+        self.clock_offset: int = None  # Estimated clock offset in ns
         self.calibration_complete = False
+        self._next_progress = self.calibration_events + 10  # events_received at the next progress line
+        self._calibration_median = RunningMedian()  # Fed during calibration, read once at the boundary
+        # Progress lines buffered off the receive path; deque.append is thread-safe, and a
+        # background writer (see _log_writer) drains them so progress lines are never written on
+        # the receive thread; only the error and close paths flush synchronously there
+        self._log = deque()
+        self._log_lock = threading.Lock()  # Serialises drains between the writer and other threads
+        self._log_stop = threading.Event()
+
+        # Bound methods used on every frame, resolved once instead of per message
+        self._log_append = self._log.append
+        self._decode = self._decoder.decode if self._decoder is not None else None
+        self._loads = _json_loads  # orjson.loads, or json.loads (which also accepts bytes)
+        self._push_calibration_sample = self._calibration_median.push
+
+        # Per-event handler for the current phase (see _on_event_calibrating)
+        if self.calibration_events > 0:
+            self._on_event = self._on_event_calibrating
+        else:
+            self.calibration_complete = True  # Skip calibration entirely
+            self._on_event = self._on_event_raw_only
 
     def fetch_market_info(self) -> Dict[str, Any]:
         """Fetch market information from Polymarket REST API to get token IDs."""
         print(f"Fetching market info for slug: {self.market_slug}")
-        response = requests.get(self.api_url)
-        response.raise_for_status()
-        market_data = response.json()
+        # urlopen raises HTTPError for non-2xx responses
+        with urlopen(self.api_url, timeout=API_TIMEOUT) as response:
+            market_data = _json_loads(response.read())
 
         print(f"Market: {market_data.get('question', 'N/A')}")
         print(f"Condition ID: {market_data.get('conditionId', 'N/A')}")
@@ -64,141 +223,338 @@ class PolymarketLatencyTracker:
         print(f"Token IDs: {self.token_ids}")
         return market_data
 
-    def on_message(self, ws, message):
+    def _flush_log(self):
+        """Write buffered progress lines to stdout in a single call."""
+        log = self._log
+        with self._log_lock:
+            if log:
+                # Producers only append, so popping the current length never races
+                lines = [log.popleft() for _ in range(len(log))]
+                sys.stdout.write('\n'.join(lines) + '\n')
+                sys.stdout.flush()
+
+    def _log_writer(self):
+        """Background thread: flush buffered lines every LOG_FLUSH_INTERVAL until stopped."""
+        while not self._log_stop.wait(LOG_FLUSH_INTERVAL):
+            self._flush_log()
+
+    def on_message(self, ws, message: bytes):
         """Handle incoming websocket messages."""
-        receive_time_ms = time.time() * 1000  # Local receipt time in milliseconds
+        # Local receipt time in nanoseconds is taken before any processing
+        if self._handle_message(message, time.time_ns()):
+            ws.close()
 
-        try:
-            data = json.loads(message)
-
-            # Handle both list and dict responses
-            if isinstance(data, list):
-                # Some initial messages might be arrays, skip them
-                print(f"Received array message (length: {len(data)}), skipping...")
-                return
+    def _handle_message(self, message: Union[bytes, str], receive_time_ns: int) -> bool:
+        """Record one websocket frame; returns True once num_events have been collected.
 
-            if not isinstance(data, dict):
-                print(f"Received non-dict, non-list message: {type(data)}")
-                return
+        websocket-client and websockets deliver text frames as raw (unvalidated)
+        UTF-8 bytes; aiohttp always decodes them to str. The decoders accept both.
+        """
+        log = self._log_append
+        decode = self._decode
+        loads = self._loads
 
-            # Extract timestamp from the event (if available)
-            event_timestamp = data.get('timestamp')
-            event_type = data.get('event_type', 'unknown')
+        try:
+            data = None
+            if decode is not None:
+                try:
+                    data = decode(message)
+                except msgspec.DecodeError:
+                    # Unexpected shape: retry as generic JSON below
+                    pass
+            if data is None:
+                try:
+                    data = loads(message)
+                except ValueError:
+                    # json/orjson JSONDecodeError, or UnicodeDecodeError from json.loads on invalid UTF-8 bytes
+                    if type(message) is bytes:
+                        message = message.decode('utf-8', 'replace')
+                    log(f"Failed to parse message: {message}")
+                    return False
+
+            # Extract timestamp from the event (if available); non-event shapes go to _handle_nondict
+            if type(data) is MarketEvent:
+                event_timestamp = data.timestamp
+            else:
+                try:
+                    event_timestamp = data['timestamp']
+                except (TypeError, KeyError):
+                    self._handle_nondict(data)
+                    return False
 
             if event_timestamp:
-                # Convert event timestamp to float if it's a string
-                if isinstance(event_timestamp, str):
-                    event_timestamp = float(event_timestamp)
-
-                # Calculate raw latency in milliseconds
-                raw_latency_ms = receive_time_ms - event_timestamp
-                self.raw_latencies.append(raw_latency_ms)
-                self.event_timestamps.append(event_timestamp)
-                self.receive_timestamps.append(receive_time_ms)
-                self.events_received += 1
-
-                # Calibration phase: collect first N events to estimate clock offset
-                if not self.calibration_complete and self.calibration_events > 0:
-                    if self.events_received == 1:
-                        print(f"First event received! Type: {event_type}")
-                        print(f"  Raw latency: {raw_latency_ms:.2f}ms")
-                        print(f"  Calibrating clock offset using first {self.calibration_events} events...")
-
-                    if self.events_received >= self.calibration_events:
-                        # Calculate clock offset as median of raw latencies
-                        self.clock_offset = statistics.median(self.raw_latencies[:self.calibration_events])
-                        self.calibration_complete = True
-                        print(f"\n✓ Calibration complete!")
-                        print(f"  Estimated clock offset: {self.clock_offset:.2f}ms")
-                        print(f"  Collecting remaining events with offset correction...\n")
-
-                # If calibration is disabled (calibration_events == 0), mark as complete immediately
-                elif not self.calibration_complete and self.calibration_events == 0:
-                    if self.events_received == 1:
-                        print(f"First event received! Type: {event_type}")
-                        print(f"  Raw latency: {raw_latency_ms:.2f}ms")
-                        print(f"  Clock calibration DISABLED - using raw measurements only\n")
-                    self.calibration_complete = True  # Skip calibration entirely
-
-                # Apply clock offset correction (only if calibration was done)
-                if self.calibration_complete and self.clock_offset is not None:
-                    adjusted_latency_ms = raw_latency_ms - self.clock_offset
-                    self.adjusted_latencies.append(adjusted_latency_ms)
-
-                    # Print progress every 10 events (after calibration)
-                    if (self.events_received - self.calibration_events) % 10 == 0 and self.events_received > self.calibration_events:
-                        print(f"Received {self.events_received}/{self.num_events} events | "
-                              f"Type: {event_type} | Adjusted latency: {adjusted_latency_ms:.2f}ms")
-
-                # Print progress for raw measurements when calibration is disabled
-                elif self.calibration_complete and self.clock_offset is None:
-                    if self.events_received % 10 == 0 or self.verbose:
-                        output = f"Received {self.events_received}/{self.num_events} events | Type: {event_type} | Raw latency: {raw_latency_ms:.2f}ms"
-                        if self.verbose:
-                            # Calculate time since last event
-                            if len(self.event_timestamps) > 1:
-                                time_since_last = event_timestamp - self.event_timestamps[-2]
-                                output += f" | Gap: {time_since_last:.0f}ms"
-                        print(output)
-
-                # Close connection after collecting enough events
-                if self.events_received >= self.num_events:
-                    print(f"\nCollected {self.num_events} events. Closing connection...")
-                    ws.close()
+                return self._on_event(event_timestamp, data, receive_time_ns)
             else:
                 # Some messages might not have timestamps (e.g., subscription confirmations)
-                print(f"Received message without timestamp: {event_type}")
-
-        except json.JSONDecodeError:
-            # Might be a PING/PONG message
-            if message.strip() not in ["PING", "PONG"]:
-                print(f"Failed to parse message: {message}")
-        except Exception as e:
-            print(f"Error processing message: {e}")
-            import traceback
-            traceback.print_exc()
+                log(f"Received message without timestamp: {_event_type(data)}")
+
+        except Exception:
+            self._flush_log()
+            logger.exception("Error processing message")
+        return False
+
+    def _handle_nondict(self, data: Any):
+        """Log a decoded frame that is not a timestamped event dict."""
+        data_type = type(data)
+        if data_type is dict:
+            log_line = f"Received message without timestamp: {_event_type(data)}"
+        elif data_type is list:
+            # Some initial messages might be arrays, skip them
+            log_line = f"Received array message (length: {len(data)}), skipping..."
+        else:
+            log_line = f"Received non-dict, non-list message: {data_type}"
+        self._log_append(log_line)
 
     def on_error(self, ws, error):
         """Handle websocket errors."""
+        self._flush_log()
         print(f"WebSocket Error: {error}")
 
     def on_close(self, ws, close_status_code, close_msg):
         """Handle websocket connection close."""
+        self._flush_log()
         print(f"WebSocket closed: {close_status_code} - {close_msg}")
 
-    def ping(self, ws):
-        """Send periodic PING messages to keep connection alive."""
-        while ws.keep_running:
+    # Per-event handlers. _on_event points at the one for the current phase and is
+    # swapped at each transition, so no handler re-checks which phase it is in:
+    #   _on_event_calibrating -> _on_event_steady -> _on_event_collected   (calibration_events > 0)
+    #   _on_event_raw_only -> _on_event_collected                            (calibration disabled)
+    # Each returns True once num_events have been collected.
+
+    def _on_event_calibrating(self, event_timestamp, event: Any, receive_time_ns: int) -> bool:
+        """Record an event and feed it to the clock-offset estimate."""
+        log = self._log_append
+        n = self.events_received
+        raw_latency_ns = record_event(event_timestamp, receive_time_ns, n,
+                                      self.raw_latencies, self.event_timestamps)
+        n += 1
+        self.events_received = n
+
+        if n == 1:
+            log(f"First event received! Type: {_event_type(event)}")
+            log(f"  Raw latency: {raw_latency_ns / 1e6:.2f}ms")
+            log(f"  Calibrating clock offset using first {self.calibration_events} events...")
+
+        self._push_calibration_sample(raw_latency_ns)
+
+        # calibration_events is at most num_events // 2, so collection cannot finish here
+        if n >= self.calibration_events:
+            # Clock offset is the running median of the calibration latencies
+            self.clock_offset = clock_offset = int(self._calibration_median.median())
+            self.calibration_complete = True
+            self._on_event = self._on_event_steady
+            log(f"\n✓ Calibration complete!")
+            log(f"  Estimated clock offset: {clock_offset / 1e6:.2f}ms")
+            log(f"  Collecting remaining events with offset correction...\n")
+
+            # The boundary event is the first adjusted sample
+            self.adjusted_latencies[self.adjusted_count] = raw_latency_ns - clock_offset
+            self.adjusted_count += 1
+        return False
+
+    def _on_event_steady(self, event_timestamp, event: Any, receive_time_ns: int) -> bool:
+        """Record an event and its offset-corrected latency."""
+        n = self.events_received
+        raw_latency_ns = record_event(event_timestamp, receive_time_ns, n,
+                                      self.raw_latencies, self.event_timestamps)
+        adjusted_latency_ns = raw_latency_ns - self.clock_offset
+        self.adjusted_latencies[self.adjusted_count] = adjusted_latency_ns
+        self.adjusted_count += 1
+        n += 1
+        self.events_received = n
+
+        # Print progress every 10 events (after calibration)
+        if n >= self._next_progress:
+            self._next_progress += 10
+            self._log_append(f"Received {n}/{self.num_events} events | "
+                             f"Type: {_event_type(event)} | Adjusted latency: {adjusted_latency_ns / 1e6:.2f}ms")
+
+        if n >= self.num_events:
+            return self._finish_collection()
+        return False
+
+    def _on_event_raw_only(self, event_timestamp, event: Any, receive_time_ns: int) -> bool:
+        """Record an event when calibration is disabled (raw latencies only)."""
+        log = self._log_append
+        n = self.events_received
+        raw_latency_ns = record_event(event_timestamp, receive_time_ns, n,
+                                      self.raw_latencies, self.event_timestamps)
+        n += 1
+        self.events_received = n
+
+        if n == 1:
+            log(f"First event received! Type: {_event_type(event)}")
+            log(f"  Raw latency: {raw_latency_ns / 1e6:.2f}ms")
+            log(f"  Clock calibration DISABLED - using raw measurements only\n")
+
+        # `__debug__ and` lets `python -O` compile the verbose path out entirely
+        verbose = __debug__ and self.verbose
+        progress_due = n >= self._next_progress
+        if progress_due:
+            self._next_progress += 10
+        if progress_due or verbose:
+            output = f"Received {n}/{self.num_events} events | Type: {_event_type(event)} | Raw latency: {raw_latency_ns / 1e6:.2f}ms"
+            if __debug__ and verbose:
+                # Calculate time since last event
+                if n > 1:
+                    time_since_last_ns = self.event_timestamps[n - 1] - self.event_timestamps[n - 2]
+                    output += f" | Gap: {time_since_last_ns / 1e6:.0f}ms"
+            log(output)
+
+        if n >= self.num_events:
+            return self._finish_collection()
+        return False
+
+    def _on_event_collected(self, event_timestamp, event: Any, receive_time_ns: int) -> bool:
+        """Drop frames still in flight after the connection was asked to close."""
+        return False
+
+    def _finish_collection(self) -> bool:
+        """Stop recording once num_events have been collected."""
+        self._on_event = self._on_event_collected
+        self._log_append(f"\nCollected {self.num_events} events. Closing connection...")
+        return True
+
+    def _socket_options(self) -> List[tuple]:
+        """(level, option, value) tuples to apply to the connected websocket socket.
+
+        TCP_NODELAY is not included: websocket-client and asyncio already set it.
+        """
+        options = []
+        if self.busy_poll:
+            # Busy-poll this socket's NAPI queue; run() only enables this when net.core.busy_poll
+            # is set, since that sysctl is what makes select/epoll spin
+            options.append((socket.SOL_SOCKET, SO_BUSY_POLL, BUSY_POLL_USECS))
+            options.append((socket.SOL_SOCKET, SO_PREFER_BUSY_POLL, 1))
+        return options
+
+    def _apply_socket_options(self, sock):
+        """Apply _socket_options() to sock, reporting (not failing on) unsupported options."""
+        if sock is None:
+            return
+        for level, option, value in self._socket_options():
             try:
-                ws.send("PING")
-                time.sleep(10)
-            except Exception:
-                break
+                sock.setsockopt(level, option, value)
+            except OSError as e:
+                print(f"Could not set socket option {option}: {e}")
+
+    def _pin_receive_thread(self):
+        """Pin the calling (receive) thread to self.cpu and, as root, raise it to SCHED_FIFO.
+
+        Called once the connection is open: Linux threads inherit affinity and policy, so
+        helper threads started while connecting (websocket-client's pinger, the event
+        loop's resolver pool) stay off the measurement CPU.
+        """
+        if self.cpu is None:
+            return
+        if not hasattr(os, "sched_setaffinity"):
+            print("--cpu is only supported on Linux; ignoring.\n")
+            return
 
-    def on_open(self, ws):
-        """Handle websocket connection open and send subscription message."""
-        print(f"WebSocket connected. Subscribing to market...")
+        try:
+            os.sched_setaffinity(0, {self.cpu})
+            print(f"Pinned receive thread to CPU {self.cpu}")
+        except OSError as e:
+            print(f"Could not pin to CPU {self.cpu}: {e}")
+            return
 
-        # Subscribe to the market channel with the token IDs
-        subscription_message = {
+        if os.geteuid() == 0:
+            try:
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(RECEIVE_THREAD_PRIORITY))
+                print(f"Receive thread scheduled SCHED_FIFO (priority {RECEIVE_THREAD_PRIORITY})")
+            except OSError as e:
+                print(f"Could not set SCHED_FIFO: {e}")
+
+    def _subscription_message(self) -> Dict[str, Any]:
+        """Subscribe to the market channel with the token IDs."""
+        return {
             "assets_ids": self.token_ids,
             "type": "market"
         }
 
-        ws.send(json.dumps(subscription_message))
-        print(f"Subscription message sent: {subscription_message}")
+    def on_open(self, ws):
+        """Handle websocket connection open and send subscription message."""
+        print(f"WebSocket connected. Subscribing to market...")
+        # on_open runs on the receive thread after run_forever has started its ping thread
+        self._pin_receive_thread()
+        self._apply_socket_options(ws.sock.sock)
+
+        ws.send(self._subscribe_payload, opcode=ABNF.OPCODE_TEXT)
+        print(f"Subscription message sent: {self._subscribe_payload.decode()}")
+
+    async def _run_websockets(self):
+        """Collect events over the asyncio `websockets` transport (keepalive: ping_interval/ping_timeout)."""
+        try:
+            async with ws_connect(self.ws_url, ping_interval=PING_INTERVAL, ping_timeout=PING_TIMEOUT) as ws:
+                print(f"WebSocket connected. Subscribing to market...")
+                self._pin_receive_thread()
+                self._apply_socket_options(ws.transport.get_extra_info("socket"))
+                await ws.send(self._subscribe_payload, text=True)
+                print(f"Subscription message sent: {self._subscribe_payload.decode()}")
+
+                handle_message = self._handle_message
+                while True:
+                    # decode=False hands the frame over as bytes, which orjson parses directly
+                    message = await ws.recv(decode=False)
+                    if handle_message(message, time.time_ns()):
+                        break
+        except ConnectionClosed as e:
+            self.on_close(None, e.rcvd.code if e.rcvd else None, e.rcvd.reason if e.rcvd else None)
+            return
+        except (OSError, WebSocketException) as e:
+            self.on_error(None, e)
+            return
+        self.on_close(ws, ws.close_code, ws.close_reason)
 
-        # Start ping thread to keep connection alive
-        self.ping_thread = threading.Thread(target=self.ping, args=(ws,))
-        self.ping_thread.daemon = True
-        self.ping_thread.start()
+    async def _run_aiohttp(self):
+        """Collect events over an aiohttp websocket (keepalive: heartbeat)."""
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.ws_connect(self.ws_url, heartbeat=PING_INTERVAL) as ws:
+                    print(f"WebSocket connected. Subscribing to market...")
+                    self._pin_receive_thread()
+                    self._apply_socket_options(ws.get_extra_info("socket"))
+                    await ws.send_str(self._subscribe_payload.decode())
+                    print(f"Subscription message sent: {self._subscribe_payload.decode()}")
+
+                    handle_message = self._handle_message
+                    text = aiohttp.WSMsgType.TEXT
+                    async for msg in ws:
+                        receive_time_ns = time.time_ns()
+                        if msg.type is text:
+                            if handle_message(msg.data, receive_time_ns):
+                                break
+                        elif msg.type is aiohttp.WSMsgType.ERROR:
+                            self.on_error(ws, ws.exception())
+                            return
+        except aiohttp.ClientError as e:
+            self.on_error(None, e)
+            return
+        self.on_close(ws, ws.close_code, None)
+
+    def _run_event_loop(self, coro):
+        """Run coro to completion, on uvloop where available (Linux/macOS).
+
+        Ctrl-C cancels coro; like websocket-client's run_forever, the interrupt is
+        reported through on_error/on_close so the samples collected so far are kept.
+        """
+        try:
+            if uvloop is not None:
+                uvloop.run(coro)
+            else:
+                asyncio.run(coro)
+        except KeyboardInterrupt as e:
+            self.on_error(None, e)
+            self.on_close(None, None, None)
 
     def run(self):
         """Main execution flow."""
         # Step 1: Fetch market information to get token IDs
         try:
             self.fetch_market_info()
-        except requests.exceptions.RequestException as e:
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            # URLError/HTTPError and timeouts are OSErrors; InvalidURL/IncompleteRead/BadStatusLine
+            # are HTTPExceptions; a malformed body is a ValueError
             print(f"Failed to fetch market info: {e}")
             return
 
@@ -206,162 +562,239 @@ class PolymarketLatencyTracker:
             print("No token IDs found for this market. Cannot proceed.")
             return
 
-        # Step 2: Connect to WebSocket and collect events
+        # Encode the subscription once; it is resent unchanged on every connect
+        self._subscribe_payload = _json_dumps(self._subscription_message())
+
+        # Step 2: Connect to WebSocket and collect events. The receive thread is pinned
+        # on connect (see _pin_receive_thread), after the log writer has started.
+        log_writer = threading.Thread(target=self._log_writer, name="log-writer", daemon=True)
+        log_writer.start()
         print(f"\nConnecting to WebSocket: {self.ws_url}")
         print(f"Collecting {self.num_events} events...\n")
 
-        self.ws = WebSocketApp(
-            self.ws_url,
-            on_open=self.on_open,
-            on_message=self.on_message,
-            on_error=self.on_error,
-            on_close=self.on_close
-        )
+        if self.busy_poll:
+            if not sys.platform.startswith("linux"):
+                print("--busy-poll is only supported on Linux; ignoring.\n")
+                self.busy_poll = False
+            elif not busy_poll_sysctl():
+                print(f"--busy-poll needs net.core.busy_poll > 0 (e.g. sysctl -w net.core.busy_poll={BUSY_POLL_USECS}), "
+                      f"since every transport waits in select/epoll; ignoring.\n")
+                self.busy_poll = False
+
+        if ((self.transport == "websockets" and ws_connect is None)
+                or (self.transport == "aiohttp" and aiohttp is None)):
+            print(f"The {self.transport} transport requires the '{TRANSPORTS[self.transport]}' package; "
+                  f"falling back to websocket-client.\n")
+            self.transport = "websocket-client"
 
-        # Run the WebSocket connection (this blocks until closed)
-        self.ws.run_forever()
+        try:
+            if self.transport == "websockets":
+                self._run_event_loop(self._run_websockets())
+            elif self.transport == "aiohttp":
+                self._run_event_loop(self._run_aiohttp())
+            else:
+                self.ws = WebSocketApp(
+                    self.ws_url,
+                    on_open=self.on_open,
+                    on_message=self.on_message,
+                    on_error=self.on_error,
+                    on_close=self.on_close
+                )
+
+                # Run the WebSocket connection (this blocks until closed); keepalive: ping_interval/ping_timeout.
+                # skip_utf8_validation leaves text frames as bytes, which the decoders parse directly.
+                self.ws.run_forever(ping_interval=PING_INTERVAL, ping_timeout=PING_TIMEOUT, ping_payload=PING_PAYLOAD,
+                                    skip_utf8_validation=True)
+        finally:
+            self._log_stop.set()
+            log_writer.join()
 
         # Step 3: Calculate and display latency statistics
         self.display_results()
 
     def display_results(self):
         """Calculate and display latency statistics."""
-        if not self.raw_latencies:
+        self._flush_log()
+        if not self.events_received:
             print("\nNo latency data collected.")
             return
 
-        print(f"\n{'='*60}")
-        print("LATENCY STATISTICS")
-        print(f"{'='*60}")
+        # Build the whole report in memory and write it with a single call
+        buf = io.StringIO()
+        print(f"\n{'='*60}", file=buf)
+        print("LATENCY STATISTICS", file=buf)
+        print(f"{'='*60}", file=buf)
+
+        # Samples are stored as int64 ns; convert to ms once for reporting
+        n = self.events_received
+        raw = self.raw_latencies[:n] / 1e6
+        adjusted = self.adjusted_latencies[:self.adjusted_count] / 1e6
 
         # Display raw statistics
-        raw_median = statistics.median(self.raw_latencies)
-        raw_mean = statistics.mean(self.raw_latencies)
-        raw_stdev = statistics.stdev(self.raw_latencies) if len(self.raw_latencies) > 1 else 0
+        raw_median = np.median(raw)
+        raw_mean = raw.mean()
+        raw_stdev = raw.std(ddof=1) if raw.size > 1 else 0
 
         # If calibration was disabled, show raw as the primary measurement
         if self.clock_offset is None:
-            print(f"\nLATENCY MEASUREMENTS (NTP-synced, no calibration):")
-            print(f"  Total events: {len(self.raw_latencies)}")
-            print(f"  Median latency: {raw_median:.2f}ms")
-            print(f"  Mean latency: {raw_mean:.2f}ms")
-            print(f"  Min latency: {min(self.raw_latencies):.2f}ms")
-            print(f"  Max latency: {max(self.raw_latencies):.2f}ms")
-            if len(self.raw_latencies) > 1:
-                print(f"  Std deviation: {raw_stdev:.2f}ms")
-
-            # Show percentiles
-            sorted_raw = sorted(self.raw_latencies)
-            p25 = sorted_raw[len(sorted_raw) // 4]
-            p75 = sorted_raw[3 * len(sorted_raw) // 4]
-            p95 = sorted_raw[int(0.95 * len(sorted_raw))] if len(sorted_raw) > 1 else sorted_raw[0]
-            p99 = sorted_raw[int(0.99 * len(sorted_raw))] if len(sorted_raw) > 1 else sorted_raw[0]
-
-            print(f"\n  Percentiles:")
-            print(f"    25th: {p25:.2f}ms")
-            print(f"    75th: {p75:.2f}ms")
-            print(f"    95th: {p95:.2f}ms")
-            print(f"    99th: {p99:.2f}ms")
-
-            print(f"\n  Interpretation:")
-            print(f"    Median latency of {raw_median:.2f}ms represents the typical time")
-            print(f"    from when Polymarket creates an event to when you receive it.")
-            print(f"    Std deviation of {raw_stdev:.2f}ms shows network variability.")
+            print(f"\nLATENCY MEASUREMENTS (NTP-synced, no calibration):", file=buf)
+            print(f"  Total events: {raw.size}", file=buf)
+            print(f"  Median latency: {raw_median:.2f}ms", file=buf)
+            print(f"  Mean latency: {raw_mean:.2f}ms", file=buf)
+            print(f"  Min latency: {raw.min():.2f}ms", file=buf)
+            print(f"  Max latency: {raw.max():.2f}ms", file=buf)
+            if raw.size > 1:
+                print(f"  Std deviation: {raw_stdev:.2f}ms", file=buf)
+
+            # Show percentiles: one np.partition (introselect) pass, no full sort. 'lower' returns
+            # actual samples, but at rank floor(q*(n-1)) rather than the previous sorted[int(q*n)],
+            # so values can differ from older runs (e.g. p99 of 100 samples is now the 2nd largest)
+            p25, p75, p95, p99 = np.percentile(raw, [25, 75, 95, 99], method='lower')
+
+            print(f"\n  Percentiles:", file=buf)
+            print(f"    25th: {p25:.2f}ms", file=buf)
+            print(f"    75th: {p75:.2f}ms", file=buf)
+            print(f"    95th: {p95:.2f}ms", file=buf)
+            print(f"    99th: {p99:.2f}ms", file=buf)
+
+            print(f"\n  Interpretation:", file=buf)
+            print(f"    Median latency of {raw_median:.2f}ms represents the typical time", file=buf)
+            print(f"    from when Polymarket creates an event to when you receive it.", file=buf)
+            print(f"    Std deviation of {raw_stdev:.2f}ms shows network variability.", file=buf)
 
             # Detect potential batching/queueing issues
             if raw_stdev > raw_median * 1.5:
-                print(f"\n  ⚠️  High Variance Detected:")
-                print(f"    Std deviation ({raw_stdev:.2f}ms) is {raw_stdev/raw_median:.1f}x the median.")
-                print(f"    This suggests server-side batching/queueing, not just network jitter.")
-                print(f"    Events may be timestamped at creation but queued before sending.")
-
-            # Analyze event timestamp gaps to detect batching
-            if len(self.event_timestamps) > 10:
-                gaps = [self.event_timestamps[i] - self.event_timestamps[i-1]
-                        for i in range(1, len(self.event_timestamps))]
-                median_gap = statistics.median(gaps)
-                max_gap = max(gaps)
-                print(f"\n  Event Timing Analysis:")
-                print(f"    Median time between events: {median_gap:.0f}ms")
-                print(f"    Max gap between events: {max_gap:.0f}ms")
-                if max_gap > median_gap * 10:
-                    print(f"    ⚠️  Large gaps detected - events may arrive in bursts")
+                print(f"\n  ⚠️  High Variance Detected:", file=buf)
+                print(f"    Std deviation ({raw_stdev:.2f}ms) is {raw_stdev/raw_median:.1f}x the median.", file=buf)
+                print(f"    This suggests server-side batching/queueing, not just network jitter.", file=buf)
+                print(f"    Events may be timestamped at creation but queued before sending.", file=buf)
+
+            # Analyze event timestamp gaps to detect batching (int64 ns, no float conversion)
+            if n > 10:
+                gaps = np.diff(self.event_timestamps[:n])
+                median_gap = np.median(gaps)
+                max_gap = gaps.max()
+                print(f"\n  Event Timing Analysis:", file=buf)
+                print(f"    Median time between events: {median_gap / 1e6:.0f}ms", file=buf)
+                print(f"    Max gap between events: {max_gap / 1e6:.0f}ms", file=buf)
+                if (gaps > 10 * median_gap).any():
+                    print(f"    ⚠️  Large gaps detected - events may arrive in bursts", file=buf)
         else:
             # Show raw as secondary when calibration was used
-            print(f"\nRAW MEASUREMENTS (before calibration):")
-            print(f"  Total events: {len(self.raw_latencies)}")
-            print(f"  Median: {raw_median:.2f}ms")
-            print(f"  Mean: {raw_mean:.2f}ms")
-            print(f"  Min: {min(self.raw_latencies):.2f}ms")
-            print(f"  Max: {max(self.raw_latencies):.2f}ms")
-            if len(self.raw_latencies) > 1:
-                print(f"  Std deviation: {raw_stdev:.2f}ms")
+            print(f"\nRAW MEASUREMENTS (before calibration):", file=buf)
+            print(f"  Total events: {raw.size}", file=buf)
+            print(f"  Median: {raw_median:.2f}ms", file=buf)
+            print(f"  Mean: {raw_mean:.2f}ms", file=buf)
+            print(f"  Min: {raw.min():.2f}ms", file=buf)
+            print(f"  Max: {raw.max():.2f}ms", file=buf)
+            if raw.size > 1:
+                print(f"  Std deviation: {raw_stdev:.2f}ms", file=buf)
 
         # Display adjusted statistics if calibration was completed
-        if self.adjusted_latencies and self.clock_offset is not None:
-            print(f"\n{'─'*60}")
-            print(f"ADJUSTED MEASUREMENTS (clock offset removed):")
-            print(f"  Clock offset applied: {self.clock_offset:.2f}ms")
-            print(f"  Events used: {len(self.adjusted_latencies)} (after calibration)")
+        if adjusted.size and self.clock_offset is not None:
+            print(f"\n{'─'*60}", file=buf)
+            print(f"ADJUSTED MEASUREMENTS (clock offset removed):", file=buf)
+            print(f"  Clock offset applied: {self.clock_offset / 1e6:.2f}ms", file=buf)
+            print(f"  Events used: {adjusted.size} (after calibration)", file=buf)
 
-            adj_median = statistics.median(self.adjusted_latencies)
-            adj_mean = statistics.mean(self.adjusted_latencies)
+            adj_median = np.median(adjusted)
+            adj_mean = adjusted.mean()
+            adj_stdev = None
 
-            print(f"\n  Median latency: {adj_median:.2f}ms")
-            print(f"  Mean latency: {adj_mean:.2f}ms")
-            print(f"  Min latency: {min(self.adjusted_latencies):.2f}ms")
-            print(f"  Max latency: {max(self.adjusted_latencies):.2f}ms")
+            print(f"\n  Median latency: {adj_median:.2f}ms", file=buf)
+            print(f"  Mean latency: {adj_mean:.2f}ms", file=buf)
+            print(f"  Min latency: {adjusted.min():.2f}ms", file=buf)
+            print(f"  Max latency: {adjusted.max():.2f}ms", file=buf)
 
-            if len(self.adjusted_latencies) > 1:
-                adj_stdev = statistics.stdev(self.adjusted_latencies)
-                print(f"  Std deviation: {adj_stdev:.2f}ms")
+            if adjusted.size > 1:
+                adj_stdev = adjusted.std(ddof=1)
+                print(f"  Std deviation: {adj_stdev:.2f}ms", file=buf)
 
             # Percentiles for adjusted latencies
-            sorted_adj = sorted(self.adjusted_latencies)
-            p25 = sorted_adj[len(sorted_adj) // 4]
-            p75 = sorted_adj[3 * len(sorted_adj) // 4]
-            p95 = sorted_adj[int(0.95 * len(sorted_adj))] if len(sorted_adj) > 1 else sorted_adj[0]
-            p99 = sorted_adj[int(0.99 * len(sorted_adj))] if len(sorted_adj) > 1 else sorted_adj[0]
-
-            print(f"\n  Percentiles:")
-            print(f"    25th: {p25:.2f}ms")
-            print(f"    75th: {p75:.2f}ms")
-            print(f"    95th: {p95:.2f}ms")
-            print(f"    99th: {p99:.2f}ms")
-
-            print(f"\n  Interpretation:")
-            print(f"    Median latency of {adj_median:.2f}ms represents the typical time")
-            print(f"    from when Polymarket creates an event to when you receive it.")
+            p25, p75, p95, p99 = np.percentile(adjusted, [25, 75, 95, 99], method='lower')
+
+            print(f"\n  Percentiles:", file=buf)
+            print(f"    25th: {p25:.2f}ms", file=buf)
+            print(f"    75th: {p75:.2f}ms", file=buf)
+            print(f"    95th: {p95:.2f}ms", file=buf)
+            print(f"    99th: {p99:.2f}ms", file=buf)
+
+            print(f"\n  Interpretation:", file=buf)
+            print(f"    Median latency of {adj_median:.2f}ms represents the typical time", file=buf)
+            print(f"    from when Polymarket creates an event to when you receive it.", file=buf)
             if adj_stdev is not None:
-                print(f"    Std deviation of {adj_stdev:.2f}ms shows network variability.")
+                print(f"    Std deviation of {adj_stdev:.2f}ms shows network variability.", file=buf)
+
+        print(f"{'='*60}", file=buf)
+        sys.stdout.write(buf.getvalue())
+        sys.stdout.flush()
+
 
-        print(f"{'='*60}")
+def print_usage():
+    print("Usage: python polymarket_latency.py <market-slug> [num_events] [calibration_events] [--verbose] [--asyncio|--aiohttp] [--busy-poll] [--cpu N|auto]")
+    print("\nArguments:")
+    print("  market-slug         : Polymarket market slug (required)")
+    print("  num_events          : Total events to collect (default: 100)")
+    print("  calibration_events  : Events to use for clock offset calibration (default: 10)")
+    print("  --verbose, -v       : Show detailed output for each event (ignored under python -O)")
+    print("  --asyncio           : Use the asyncio 'websockets' transport (uvloop if installed)")
+    print("  --aiohttp           : Use the asyncio 'aiohttp' transport (uvloop if installed)")
+    print("  --busy-poll         : Busy-poll the socket on receive (Linux, needs net.core.busy_poll > 0)")
+    print("  --cpu N|auto        : Pin the receive thread to CPU N, or to the NIC's IRQ CPU (Linux)")
+    print("\nExample:")
+    print("  python polymarket_latency.py btc-updown-15m-1769050800 500 0")
+    print("  python polymarket_latency.py btc-updown-15m-1769050800 100 10 --verbose")
 
 
 def main():
-    import sys
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s: %(message)s")
 
     if len(sys.argv) < 2:
-        print("Usage: python polymarket_latency.py <market-slug> [num_events] [calibration_events] [--verbose]")
-        print("\nArguments:")
-        print("  market-slug         : Polymarket market slug (required)")
-        print("  num_events          : Total events to collect (default: 100)")
-        print("  calibration_events  : Events to use for clock offset calibration (default: 10)")
-        print("  --verbose, -v       : Show detailed output for each event")
-        print("\nExample:")
-        print("  python polymarket_latency.py btc-updown-15m-1769050800 500 0")
-        print("  python polymarket_latency.py btc-updown-15m-1769050800 100 10 --verbose")
+        print_usage()
         sys.exit(1)
 
-    # Check for verbose flag
-    verbose = '--verbose' in sys.argv or '-v' in sys.argv
-    args = [arg for arg in sys.argv[1:] if arg not in ['--verbose', '-v']]
+    argv = sys.argv[1:]
+
+    # --cpu takes a value, so remove it before collecting positional arguments
+    cpu = None
+    if '--cpu' in argv:
+        i = argv.index('--cpu')
+        cpu_arg = argv[i + 1] if i + 1 < len(argv) else None
+        if cpu_arg is None or cpu_arg.startswith('-'):
+            print("--cpu requires a value: a CPU number or 'auto'\n")
+            print_usage()
+            sys.exit(1)
+        del argv[i:i + 2]
+        if cpu_arg == 'auto':
+            cpu = nic_irq_cpu()
+            if cpu is None:
+                print("Could not determine the NIC's IRQ CPU; not pinning.")
+        elif cpu_arg.isdigit():
+            cpu = int(cpu_arg)
+        else:
+            print(f"--cpu expects a CPU number or 'auto', not {cpu_arg!r}\n")
+            print_usage()
+            sys.exit(1)
+
+    # Check for flags
+    verbose = '--verbose' in argv or '-v' in argv
+    busy_poll = '--busy-poll' in argv
+    if '--aiohttp' in argv:
+        transport = "aiohttp"
+    elif '--asyncio' in argv:
+        transport = "websockets"
+    else:
+        transport = "websocket-client"
+    args = [arg for arg in argv if arg not in ['--verbose', '-v', '--asyncio', '--aiohttp', '--busy-poll']]
 
     market_slug = args[0]
     num_events = int(args[1]) if len(args) > 1 else 100
     calibration_events = int(args[2]) if len(args) > 2 else 10
+    if num_events < 1:
+        print(f"num_events must be at least 1 (got {num_events})")
+        sys.exit(1)
 
-    tracker = PolymarketLatencyTracker(market_slug, num_events, calibration_events, verbose)
+    tracker = PolymarketLatencyTracker(market_slug, num_events, calibration_events, verbose, transport, busy_poll, cpu)
     tracker.run()
 
 